@@ -0,0 +1,83 @@
+from typing import Dict, Sequence, Tuple
+from components import CARD_GRADES, CARD_SIGS, CARD_SUITS
+from evaluator import Evaluator
+from itertools import combinations
+import random
+import sys
+
+"""
+Evaluator Rank Check
+--------------------
+Checks the evaluator's lookup tables against a plain hand classifier that
+knows nothing about card signatures. Run from this directory (the table
+caches are read from the working directory) after any change to the card
+or hand value encoding:
+
+    python checkevaluator.py [number of random 7 card deals]
+
+1. Every one of the 52C5 = 2,598,960 five card hands is classified and
+   ranked. Each hand class must map to exactly one rank, and ordering the
+   7462 classes from best to worst must give the ranks 0, 1, ..., 7461.
+2. For random 7 card deals, evaluate7 must equal the rank of the best
+   classified hand among the 21 five card subsets.
+"""
+
+
+def classify(idx: Sequence[int]) -> Tuple[int, ...]:
+  """Hand class of 5 card indices, where a larger tuple is a better hand"""
+  grades = sorted((CARD_GRADES[i] for i in idx), reverse=True)
+  flush = len({CARD_SUITS[i] for i in idx}) == 1
+  counts = {g: grades.count(g) for g in grades}
+  groups = sorted(counts, key=lambda g: (counts[g], g), reverse=True)
+  shape = [counts[g] for g in groups]
+  wheel = grades == [12, 3, 2, 1, 0]
+  straight = len(counts) == 5 and (grades[0] - grades[4] == 4 or wheel)
+  top = 3 if wheel else grades[0]
+
+  if straight and flush: return (8, top)
+  if shape == [4, 1]: return (7, *groups)
+  if shape == [3, 2]: return (6, *groups)
+  if flush: return (5, *grades)
+  if straight: return (4, top)
+  if shape == [3, 1, 1]: return (3, *groups)
+  if shape == [2, 2, 1]: return (2, *groups)
+  if shape == [2, 1, 1, 1]: return (1, *groups)
+  return (0, *grades)
+
+
+def checkFiveCards(evaluator: Evaluator) -> Dict[Tuple[int, ...], int]:
+  classToRank = dict()
+  hands = combinations(range(len(CARD_SIGS)), 5)
+  while True:
+    chunk = [h for _, h in zip(range(100000), hands)]
+    if not chunk:
+      break
+    ranks = evaluator.evaluateHandsBatch([[CARD_SIGS[i] for i in h]
+                                          for h in chunk])
+    for h, r in zip(chunk, ranks):
+      assert classToRank.setdefault(classify(h), r) == r, (h, r)
+
+  ordered = sorted(classToRank, reverse=True)
+  assert [classToRank[c] for c in ordered] == list(range(len(ordered)))
+  assert len(ordered) == evaluator._numKeys
+  return classToRank
+
+
+def checkSevenCards(evaluator: Evaluator,
+                    classToRank: Dict[Tuple[int, ...], int],
+                    numDeals: int) -> None:
+  rng = random.Random(0)
+  for _ in range(numDeals):
+    idx = rng.sample(range(len(CARD_SIGS)), 7)
+    best = max(classify(h) for h in combinations(idx, 5))
+    rank = evaluator.evaluate7([CARD_SIGS[i] for i in idx])
+    assert rank == classToRank[best], (idx, rank, classToRank[best])
+
+
+if __name__ == '__main__':
+  numDeals = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+  evaluator = Evaluator()
+  classToRank = checkFiveCards(evaluator)
+  print('5 card hands: OK')
+  checkSevenCards(evaluator, classToRank, numDeals)
+  print(f'{numDeals} random 7 card deals: OK')
@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import Optional, Tuple
 import random
 
 
@@ -34,37 +34,54 @@ class Rank:
             EIGHT, NINE, TEN, JACK, QUEEN, KING]
 
 
+# Prime per rank grade, so a product of primes identifies a rank multiset
+PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+
 # Card
 class Card:
   def __init__(self, rank: Tuple[int, str], 
                suit: Tuple[int, str]) -> None:
-    suitBit, self.suit = suit
-    grade, self.value = rank
+    suitBit, self._suit = suit
+    grade, self._value = rank
     self._sig = self._constructSignature(suitBit, grade)
 
   def _constructSignature(self, suitBit: int, grade: int) -> int:
     """
     Output Integer
-    +-----------------------------------------------------------------------+
-    | xxxx cdhs | xxp xxpx | xpxx pxxp | xxpx xpxx | pxxp xxpx | xpxx pxxpx |
-    +-----------------------------------------------------------------------+
+    +---------------------------------------------+
+    | xxxb bbbb | bbbb bbbb | cdhs xxxx | pppppppp |
+    +---------------------------------------------+
+    b = rank bit
     cdhs = suit bit
-    p = rank bit
+    p = prime of rank (2 for deuce, ..., 41 for ace)
     """
-    r =  1 << ((grade * 3) + 1)
+    r = 1 << grade
     s = 1 << suitBit
-    return (s << 40) + r
+    return (r << 16) | (s << 12) | PRIMES[grade]
   
+  def getSuit(self) -> str:
+    return self._suit
+
+  def getValue(self) -> str:
+    return self._value
+
   def getSignature(self) -> int:
     return self._sig
 
 
 # Deck
 class Deck:
-  def __init__(self) -> None:
-    self._stack = [Card(r, s) for s in Suit.asList for r in Rank.asList]
+  def __init__(self, seed: Optional[int] = None) -> None:
+    """
+    Each deck shuffles with its own generator rather than the global random
+    module, so pass seed (not random.seed) to reproduce a run
+    """
+    # Indices into the module level card tables
+    self._stack = list(range(len(CARD_SIGS)))
     self._loc = 0
-    random.shuffle(self._stack)
+    self._rng = random.Random(seed)
+    self._random = self._rng.random
 
   def __len__(self) -> int:
     return len(self._stack) - self._loc
@@ -75,13 +92,40 @@ class Deck:
   def countRemaining(self) -> int:
     return self.__len__()
 
+  def _drawIndex(self) -> int:
+    # One Fisher-Yates step per draw, so only the drawn cards get shuffled
+    stack, loc = self._stack, self._loc
+    j = loc + int(self._random() * (len(stack) - loc))
+    stack[loc], stack[j] = stack[j], stack[loc]
+    self._loc = loc + 1
+    return stack[loc]
+
   def draw(self) -> Card:
     if self.canDraw():
-      card = self._stack[self._loc]
-      self._loc += 1
-      return card
+      return CARDS[self._drawIndex()]
     return None      # TODO: Proper error handling
 
+  def drawSignature(self) -> int:
+    if not self.canDraw():
+      raise IndexError('draw from an empty deck')
+    return CARD_SIGS[self._drawIndex()]
+
+  def drawFields(self) -> Tuple[int, int, int]:
+    """Draw a card as (signature, suit bit, grade) without a Card object"""
+    if not self.canDraw():
+      raise IndexError('draw from an empty deck')
+    i = self._drawIndex()
+    return CARD_SIGS[i], CARD_SUITS[i], CARD_GRADES[i]
+
   def reset(self) -> None:
-    random.shuffle(self._stack)
-    self._loc = 0
\ No newline at end of file
+    # Drawing reshuffles as it goes, so resetting is just rewinding
+    self._loc = 0
+
+
+"""Tables"""
+# Every card in suit-major order built once at import. The fields are also
+# kept as parallel tables so hot paths only touch the one they need.
+CARDS = tuple(Card(r, s) for s in Suit.asList for r in Rank.asList)
+CARD_SIGS = tuple(c.getSignature() for c in CARDS)
+CARD_SUITS = tuple(s[0] for s in Suit.asList for _ in Rank.asList)
+CARD_GRADES = tuple(r[0] for _ in Suit.asList for r in Rank.asList)
@@ -1,7 +1,10 @@
-from typing import Dict, List
-from components import Card, Rank, Suit
-import csv
+from typing import Dict, List, Sequence, Tuple
+from components import PRIMES, Card, Rank, Suit
+from array import array
+from itertools import combinations, combinations_with_replacement
+from math import prod
 import os
+import sys
 
 """
 No Limit Texas Hold'em Poker Hand Evaluation Optimization Theory
@@ -52,84 +55,189 @@ determining a hand's value is the frequency of values and whether the hand
 is flushed. In other words, we do not care that a 2D and 2S are in the hand but 
 rather there are two 2s and they are not suited.
 
-From here, consider the following representation of a card as 6 bytes:
+From here, consider the following representation of a card as 4 bytes, where
+each of the 13 ranks is assigned its own prime number:
 
   Card Signature
-  +-----------------------------------------------------------------------+
-  | xxxx cdhs | xxp xxpx | xpxx pxxp | xxpx xpxx | pxxp xxpx | xpxx pxxpx |
-  +-----------------------------------------------------------------------+
+  +---------------------------------------------+
+  | xxxb bbbb | bbbb bbbb | cdhs xxxx | pppppppp |
+  +---------------------------------------------+
+  b = rank bit
   cdhs = suit bit
-  p = rank bit
+  p = prime of rank (2, 3, 5, ..., 41)
 
 Using these card signatures, we can simply evaluate the 5 card signatures to 
-construct the following hand signature using & and | operations
+construct the following hand signature using & and * operations
 
-  +-----------------------------------------------------------------------+
-  | xxxx xxxx | pppp pppp | pppp pppp | pppp pppp | pppp pppp | pppp pppf |
-  +-----------------------------------------------------------------------+
+  +---------------------------------------------+
+  | xxxx pppp | pppp pppp | pppp pppp | pppp pppf |
+  +---------------------------------------------+
   f = indicator bit whether hand is flush
-  p = frequency of card (groups of 3 bits)
+  p = product of the five rank primes
 
+Since every integer has a unique prime factorization, the product of the rank
+primes identifies the frequency of each card value, and it is at most
+41^4 * 37 < 2^27, so a hand value fits comfortably in a 32 bit integer.
 Given this definition of a hand value, we find that the size of our dictionary
 mapping is now
 
-    7462 * 2 * 8 (6 bytes + 2 bytes padding) = 119,392 B = 174.2 KB !
-                                                           (170x smaller)
+    7462 * 2 * 4 (Four Bytes Per Integer) = 59,696 B = 58.3 KB !
+                                                      (350x smaller)
 
 with a runtime on the order of 1e-06 ! (ARM-1 MacOS)
 
+Flushes can be split out of this mapping entirely: a flush has 5 distinct
+ranks, so OR-ing the rank bits of its cards gives a 13 bit mask that indexes
+a flat 8192 entry table directly, leaving only non-flush prime products to
+hash.
+
 From here, we can calculate all 7C5 = 21 possible hands constructed from both
 the player hole and the board community cards. The runtime should be on the 
-order of 1e-05. Unfortunately, it is difficult to improve runtime without a
-significant trade in space. This is because the unique combination created by 5
-cards from the 7 card pool is important information that cannot be anonymized,
-as it is possible for a simple 5 card hand.
+order of 1e-05. However, the same anonymization also applies to 7 cards:
+
+  - If no suit appears 5 or more times, no 5 card subset is a flush, and the
+    best hand only depends on the multiset of 7 ranks. There are only 49205
+    such multisets, keyed by the product of their 7 rank primes.
+  - If a suit appears 5 or more times, a full house or four of a kind would
+    need at least 8 cards, so the best hand is made of the flush suit alone.
+    There are only 13C5 + 13C6 + 13C7 = 4719 such rank sets, indexed directly
+    by their 13 bit rank mask.
+
+Precomputing the best of the 21 hands for each gives two mappings of
+
+    49205 * (8 + 2) + 8192 * 2 = 508,434 B = 496.5 KB
+
+and a 7 card evaluation becomes a single lookup on the order of 1e-06.
 
 """
 
+_SUIT_BITS = tuple(1 << s[0] for s in Suit.asList)
+
 
 class Evaluator:
 
   _numKeys = 7462
-  _mapFile = 'valtorank.csv'
+  _mapFile = 'valtorank.bin'
+  _numKeys7 = 49205           # Multisets of 7 ranks, at most 4 of each
+  _numFlushKeys7 = 4719       # Sets of 5, 6 or 7 distinct ranks
+  _map7File = 'handrank7.bin'
 
   def __init__(self) -> None:
     self._valToRank = self._setValueToRankMap()
+    self._flushToRank, self._primesToRank = self._splitValueToRankMap()
+    self._rank7ToRank, self._flush7ToRank = self._setSevenCardMaps()
 
   @staticmethod
-  def _getHandValue(hand: List[Card]) -> int:
+  def _getHandValue(c1: int, c2: int, c3: int, c4: int, c5: int) -> int:
     """
     Output Integer
-    +-----------------------------------------------------------------------+
-    | xxxx xxxx | pppp pppp | pppp pppp | pppp pppp | pppp pppp | pppp pppf |
-    +-----------------------------------------------------------------------+
+    +---------------------------------------------+
+    | xxxx pppp | pppp pppp | pppp pppp | pppp pppf |
+    +---------------------------------------------+
     f = indicator bit whether hand is flush
-    p = frequency of card (groups of 3 bits)
+    p = product of rank primes
     """
-    c1, c2, c3, c4, c5 = [c.getSignature() for c in hand]
-    v = 1 if (c1&c2&c3&c4&c5) >> 40 else 0
-    v += (c1+c2+c3+c4+c5) & 0xFFFFFFFFFF
-    return v
-
-  def _setValueToRankMap(self) -> None:
-    valToRank = dict()
-
-    # Check if preloaded dictionary exists
-    if os.path.exists(self._mapFile) and os.path.isfile(self._mapFile):
-      with open(self._mapFile, 'r') as f:
-        reader = csv.reader(f)
-        items = [(int(r[0]), int(r[1])) for r in reader]
-        valToRank = dict(items)
-    else:
-      valToRank = self._buildValueToRankMap()
-      with open(self._mapFile, 'w') as f:
-        writer = csv.writer(f)
-        writer.writerows(list(valToRank.items()))
-      
+    # Flush bit is added as a bool to keep the expression branch free
+    return ((c1&0xFF)*(c2&0xFF)*(c3&0xFF)*(c4&0xFF)*(c5&0xFF) << 1) + \
+           ((c1&c2&c3&c4&c5) & 0xF000 > 0)
+
+  @classmethod
+  def _getCardsValue(cls, hand: List[Card]) -> int:
+    return cls._getHandValue(*[c.getSignature() for c in hand])
+
+  def _setValueToRankMap(self) -> Dict:
+    # Hand values are stored as little-endian uint64s ordered by rank
+    keys = array('Q')
+
+    # Check if preloaded dictionary exists. A file from an older hand value
+    # encoding has the same size, so its best key must be the royal flush.
+    royalFlush = (prod(PRIMES[-5:]) << 1) + 1
+    if os.path.isfile(self._mapFile) and \
+       os.path.getsize(self._mapFile) == self._numKeys * 8:
+      with open(self._mapFile, 'rb') as f:
+        keys.fromfile(f, self._numKeys)
+      if sys.byteorder == 'big':
+        keys.byteswap()
+      if keys[0] == royalFlush:
+        return dict(zip(keys, range(self._numKeys)))
+      keys = array('Q')
+
+    valToRank = self._buildValueToRankMap()
+    keys.extend(sorted(valToRank, key=valToRank.get))
+    if sys.byteorder == 'big':
+      keys.byteswap()
+    with open(self._mapFile, 'wb') as f:
+      keys.tofile(f)
+    return valToRank
+
+  def _splitValueToRankMap(self) -> Tuple[List[int], Dict]:
+    vmap = self._valToRank
+
+    # Flushes are indexed directly by the mask of their 5 rank bits
+    flushToRank = [self._numKeys] * (1 << len(PRIMES))
+    for gs in combinations(range(len(PRIMES)), 5):
+      v = (prod([PRIMES[g] for g in gs]) << 1) + 1
+      flushToRank[sum([1 << g for g in gs])] = vmap[v]
+
+    # Everything else by the product of its rank primes
+    primesToRank = {v >> 1: r for v, r in vmap.items() if not v & 1}
+    return flushToRank, primesToRank
+
+  def _setSevenCardMaps(self) -> Tuple[Dict, List[int]]:
+    # The non-flush map is stored as its prime products (little-endian
+    # uint64s) followed by their ranks (little-endian uint16s), then the
+    # flush table as one little-endian uint16 rank per rank mask
+    numMasks = 1 << len(PRIMES)
+    numBytes = self._numKeys7 * (8 + 2) + numMasks * 2
+
+    # Check if preloaded dictionaries exist, rebuilding any stale layout
+    if os.path.isfile(self._map7File) and \
+       os.path.getsize(self._map7File) == numBytes:
+      keys, ranks, flushRanks = array('Q'), array('H'), array('H')
+      with open(self._map7File, 'rb') as f:
+        keys.fromfile(f, self._numKeys7)
+        ranks.fromfile(f, self._numKeys7)
+        flushRanks.fromfile(f, numMasks)
+      if sys.byteorder == 'big':
+        for a in (keys, ranks, flushRanks):
+          a.byteswap()
+      return dict(zip(keys, ranks)), flushRanks.tolist()
+
+    rank7ToRank, flush7ToRank = self._buildSevenCardMaps()
+    assert len(rank7ToRank) == self._numKeys7
+    assert sum(r < self._numKeys for r in flush7ToRank) == self._numFlushKeys7
+    arrays = (array('Q', rank7ToRank.keys()), array('H', rank7ToRank.values()),
+              array('H', flush7ToRank))
+    with open(self._map7File, 'wb') as f:
+      for a in arrays:
+        if sys.byteorder == 'big':
+          a.byteswap()
+        a.tofile(f)
+    return rank7ToRank, flush7ToRank
+
+  def _buildSevenCardMaps(self) -> Tuple[Dict, List[int]]:
+    vmap, flushToRank = self._valToRank, self._flushToRank
+    rank7ToRank = dict()
+    flush7ToRank = [self._numKeys] * len(flushToRank)
+
+    # Without a flush only the rank multiset matters, keyed by prime product
+    for ps in combinations_with_replacement(PRIMES, 7):
+      if max(map(ps.count, ps)) <= 4:
+        rank7ToRank[prod(ps)] = min([vmap[prod(h) << 1]
+                                     for h in combinations(ps, 5)])
+
+    # With a flush the best hand is made of the flush suit alone, indexed by
+    # the mask of its 5 to 7 rank bits
+    bits = [1 << g for g in range(len(PRIMES))]
+    for n in range(5, 8):
+      for bs in combinations(bits, n):
+        flush7ToRank[sum(bs)] = min([flushToRank[sum(h)]
+                                     for h in combinations(bs, 5)])
+    return rank7ToRank, flush7ToRank
+
   def _buildValueToRankMap(self) -> Dict:
     ranks = [r for r in Rank.asList]
     ranksBounded = ranks + [Rank.ACE]
-    numRanks = len(ranks)
     listFlushStraight, listStraight, listFlush, listHigh, listFourKind, \
     listThreeKind, listFullHouse, listPair, listTwoPair = \
       [], [], [], [], [], [], [], [], []
@@ -138,102 +246,91 @@ class Evaluator:
     numStraights = len(ranksBounded) - 4
     for i in reversed(range(numStraights)):
       h = [Card(r, Suit.CLUBS) for r in ranksBounded[i: i+5]]   # Arbitrary suit
-      listFlushStraight.append(self._getHandValue(h))
+      listFlushStraight.append(self._getCardsValue(h))
       h[0] = Card(ranksBounded[i], Suit.SPADES)       # Arbitrary non flush suit
-      listStraight.append(self._getHandValue(h))
+      listStraight.append(self._getCardsValue(h))
     
     # Standard Flush and High Card
     ranksReversed = ranksBounded[::-1][:-1]
-    numFlushStarts = len(ranksReversed) - 4
-    for i in range(numFlushStarts):
-      for j in range(i+1, numRanks):
-        for k in range(j+1, numRanks):
-          for m in range(k+1, numRanks):
-            for n in range(m+1, numRanks):
-              r1, r2, r3, r4, r5 = ranksReversed[i], ranksReversed[j], \
-                ranksReversed[k], ranksReversed[m], ranksReversed[n]
-              h = [Card(r1, Suit.CLUBS), Card(r2, Suit.CLUBS), 
-                   Card(r3, Suit.CLUBS), Card(r4, Suit.CLUBS),
-                   Card(r5, Suit.CLUBS)]
-              fv = self._getHandValue(h)
-              h[0] = Card(r1, Suit.SPADES)
-              hv = self._getHandValue(h)
-              if fv not in listFlushStraight: listFlush.append(fv)
-              if hv not in listStraight: listHigh.append(hv)
+    flushStraights, straights = set(listFlushStraight), set(listStraight)
+    for r1, r2, r3, r4, r5 in combinations(ranksReversed, 5):
+      h = [Card(r1, Suit.CLUBS), Card(r2, Suit.CLUBS), 
+           Card(r3, Suit.CLUBS), Card(r4, Suit.CLUBS),
+           Card(r5, Suit.CLUBS)]
+      fv = self._getCardsValue(h)
+      h[0] = Card(r1, Suit.SPADES)
+      hv = self._getCardsValue(h)
+      if fv not in flushStraights: listFlush.append(fv)
+      if hv not in straights: listHigh.append(hv)
 
     # Four, Three of a Kind and Two Pair, One Pair
-    for i in range(numRanks):
-      r1 = ranksReversed[i]
+    # Ranks are enumerated in descending order, so each list comes out sorted
+    for i, r1 in enumerate(ranksReversed):
+      others = ranksReversed[:i] + ranksReversed[i+1:]
 
       # Four of a Kind
       template = [Card(r1, Suit.CLUBS), Card(r1, Suit.DIAMONDS), \
                   Card(r1, Suit.HEARTS), Card(r1, Suit.SPADES)]
-      for j in range(numRanks):
-        if j != i:
-          h = template + [Card(ranksReversed[j], Suit.CLUBS)]
-          v = self._getHandValue(h)
-          if v not in listFourKind: listFourKind.append(v)
-      
-      # Three of a Kind
+      for r2 in others:
+        h = template + [Card(r2, Suit.CLUBS)]
+        listFourKind.append(self._getCardsValue(h))
+
+      # Full House and Three of a Kind
       template = template[:-1]
-      for j in range(numRanks):
-        for k in range(numRanks):
-          if j != i and k != i:
-            r2, r3 = ranksReversed[j], ranksReversed[k]
-            h = template + [Card(r2, Suit.CLUBS), Card(r3, Suit.HEARTS)]
-            v = self._getHandValue(h)
-            if j == k and v not in listFullHouse:
-              listFullHouse.append(v)
-            elif v not in listThreeKind:
-              listThreeKind.append(v)
-      
+      for r2 in others:
+        h = template + [Card(r2, Suit.CLUBS), Card(r2, Suit.HEARTS)]
+        listFullHouse.append(self._getCardsValue(h))
+      for r2, r3 in combinations(others, 2):
+        h = template + [Card(r2, Suit.CLUBS), Card(r3, Suit.HEARTS)]
+        listThreeKind.append(self._getCardsValue(h))
+
       # Pair and Two Pair
       template = template[:-1]
-      for j in range(numRanks):
-        for k in range(numRanks):
-          for m in range(numRanks):
-            if j != i and k != i and m != i:
-              # Pair
-              if k != j and k != m and m != j:
-                r2, r3, r4 = ranksReversed[j], ranksReversed[k], ranksReversed[m]
-                h = template + [Card(r2, Suit.CLUBS), Card(r3, Suit.HEARTS), 
-                                Card(r4, Suit.SPADES)]
-                v = self._getHandValue(h)
-                if v not in listPair: listPair.append(v)
-              # Two Pair
-              if j == k and j != m and k != m:
-                r2, r3, r4 = ranksReversed[j], ranksReversed[k], \
-                             ranksReversed[m]
-                h = template + [Card(r2, Suit.CLUBS), Card(r3, Suit.HEARTS), 
-                                Card(r4, Suit.SPADES)]
-                v = self._getHandValue(h)
-                if v not in listTwoPair: listTwoPair.append(v)
-
-    # Assure no intersecting keys
-    assert not len(set(listFlushStraight).intersection(set(listStraight))
-                                        .intersection(set(listFlush))
-                                        .intersection(set(listHigh))
-                                        .intersection(set(listFourKind))
-                                        .intersection(set(listThreeKind))
-                                        .intersection(set(listPair))
-                                        .intersection(set(listTwoPair))
-                  )
+      for r2, r3, r4 in combinations(others, 3):
+        h = template + [Card(r2, Suit.CLUBS), Card(r3, Suit.HEARTS), 
+                        Card(r4, Suit.SPADES)]
+        listPair.append(self._getCardsValue(h))
+      for r2 in ranksReversed[i+1:]:
+        for r3 in others:
+          if r3 != r2:
+            h = template + [Card(r2, Suit.CLUBS), Card(r2, Suit.HEARTS), 
+                            Card(r3, Suit.SPADES)]
+            listTwoPair.append(self._getCardsValue(h))
 
     keys = listFlushStraight + listFourKind + listFullHouse + listFlush + \
            listStraight + listThreeKind + listTwoPair + listPair + listHigh
     values = list(range(self._numKeys))
-    assert len(keys) == self._numKeys
+
+    # Assure no intersecting keys
+    assert len(set(keys)) == len(keys) == self._numKeys
     return dict(zip(keys, values))
 
+  def evaluateHandsBatch(self, sigs: List[Sequence[int]]) -> List[int]:
+    """Rank (0 is best) of each row of five card signatures."""
+    flushToRank, primesToRank = self._flushToRank, self._primesToRank
+    return [flushToRank[(c1|c2|c3|c4|c5) >> 16] if (c1&c2&c3&c4&c5) & 0xF000
+            else primesToRank[(c1&0xFF)*(c2&0xFF)*(c3&0xFF)*(c4&0xFF)*(c5&0xFF)]
+            for c1, c2, c3, c4, c5 in sigs]
+
+  def evaluate7(self, sigs: Sequence[int]) -> int:
+    """Rank (0 is best) of the best five card hand out of 7 card signatures"""
+    if len(sigs) != 7:
+      raise ValueError(f'evaluate7 takes exactly 7 cards, got {len(sigs)}')
+    suits = [(c >> 12) & 0xF for c in sigs]
+    counts = list(map(suits.count, _SUIT_BITS))
+    most = max(counts)
+    if most < 5:
+      return self._rank7ToRank[prod([c & 0xFF for c in sigs])]
+
+    # Seven cards cannot hold a flush alongside a full house or quads, so the
+    # best hand is made of the flush suit alone
+    suit = _SUIT_BITS[counts.index(most)]
+    return self._flush7ToRank[sum([c >> 16 for c, s in zip(sigs, suits)
+                                   if s == suit])]
+
   def evaluateHands(self, hands: List[List[Card]]) -> List[int]:
-    bestHands = []
-    bestScore = self._numKeys
-    for n in range(len(hands)):
-      val = self._valToRank
-      val = self._valToRank[self._getHandValue(hands[n])]
-      if val < bestScore: 
-        bestHands = [n]
-        bestScore = val
-      elif val == bestScore:
-        bestHands.append(n)
-    return bestHands
+    scores = self.evaluateHandsBatch([[c._sig for c in h] for h in hands])
+    if not scores:
+      return []
+    bestScore = min(scores)
+    return [n for n, s in enumerate(scores) if s == bestScore]